@@ -1,6 +1,13 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import codecs
+import io
+import json
+import time
 import logging
+import mimetypes
+import os
+from datetime import datetime, timezone
 from typing import Optional
 
 from app.schemas.chat import (
@@ -15,9 +22,24 @@ logger = logging.getLogger(__name__)
 # Criar router
 router = APIRouter()
 
+# Limites do upload de documentos
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 MB
+MULTIPART_OVERHEAD = 64 * 1024      # Margem para boundaries e campos do formulário
+UPLOAD_CHUNK_SIZE = 64 * 1024       # 64 KB
+ALLOWED_MIME_TYPES = {"text/plain", "text/markdown"}
+ALLOWED_EXTENSIONS = {".txt", ".md"}
+
+# Garantir o mapeamento de .md mesmo em sistemas sem a entrada
+mimetypes.add_type("text/markdown", ".md")
+
+
+def _request_timestamp(http_request: Request) -> datetime:
+    """Timestamp calculado uma única vez pelo middleware no início da requisição"""
+    return getattr(http_request.state, "timestamp", None) or datetime.now(timezone.utc)
+
 
 @router.post("/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Endpoint principal para chat com o LLM
     
@@ -25,7 +47,7 @@ async def chat(request: ChatRequest):
     Suporta manutenção de histórico através de session_id.
     """
     try:
-        logger.info(f"Processando mensagem para sessão {request.session_id}: {request.message[:50]}...")
+        logger.info("Processando mensagem para sessão %s: %s...", request.session_id, request.message[:50])
         
         # Obter resposta do serviço QA
         answer, latency_ms = await qa_service.get_chat_response(
@@ -37,22 +59,53 @@ async def chat(request: ChatRequest):
         response = ChatResponse(
             answer=answer,
             latency_ms=latency_ms,
-            session_id=request.session_id
+            session_id=request.session_id,
+            timestamp=_request_timestamp(http_request)
         )
         
-        logger.info(f"Resposta enviada com sucesso em {latency_ms}ms")
+        logger.info("Resposta enviada com sucesso em %sms", latency_ms)
         return response
         
     except Exception as e:
-        logger.error(f"Erro no endpoint /chat: {e}")
+        logger.error("Erro no endpoint /chat: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro interno do servidor: {str(e)}"
         )
 
 
+@router.post("/chat/stream", tags=["Chat"])
+async def chat_stream(request: ChatRequest):
+    """
+    Endpoint de chat com streaming (Server-Sent Events)
+    
+    Envia os tokens da resposta conforme são gerados pelo modelo, reduzindo
+    o tempo até o primeiro byte. Cada evento contém `{"token": ...}` e o
+    último evento contém `{"done": true, "latency_ms": ...}`.
+    """
+    logger.info("Processando mensagem (streaming) para sessão %s: %s...", request.session_id, request.message[:50])
+    
+    async def event_stream():
+        start_time = time.time()
+        try:
+            async for token in qa_service.stream_chat_response(
+                message=request.message,
+                session_id=request.session_id
+            ):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            
+            latency_ms = int((time.time() - start_time) * 1000)
+            yield f"data: {json.dumps({'done': True, 'latency_ms': latency_ms, 'session_id': request.session_id})}\n\n"
+            
+        except Exception as e:
+            logger.error("Erro no endpoint /chat/stream: %s", e)
+            yield f"data: {json.dumps({'error': f'Erro interno do servidor: {str(e)}'}, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("/health", response_model=HealthResponse, tags=["Health"])
-async def health_check():
+async def health_check(http_request: Request):
     """
     Endpoint de health check
     
@@ -60,7 +113,7 @@ async def health_check():
     """
     try:
         # Verificar conexão com Ollama
-        ollama_connected = qa_service.check_ollama_connection()
+        ollama_connected = await qa_service.check_ollama_connection()
         ollama_status = "connected" if ollama_connected else "disconnected"
         
         # Status geral da API
@@ -68,16 +121,18 @@ async def health_check():
         
         response = HealthResponse(
             status=api_status,
-            ollama_status=ollama_status
+            ollama_status=ollama_status,
+            timestamp=_request_timestamp(http_request)
         )
         
         return response
         
     except Exception as e:
-        logger.error(f"Erro no health check: {e}")
+        logger.error("Erro no health check: %s", e)
         return HealthResponse(
             status="unhealthy",
-            ollama_status="error"
+            ollama_status="error",
+            timestamp=_request_timestamp(http_request)
         )
 
 
@@ -93,15 +148,37 @@ async def upload_document(
     """
     try:
         # Verificar tipo do arquivo
-        if not file.filename.endswith(('.txt', '.md')):
+        filename = file.filename or ""
+        extension = os.path.splitext(filename)[1].lower()
+        mime_type, _ = mimetypes.guess_type(filename)
+        if extension not in ALLOWED_EXTENSIONS or mime_type not in ALLOWED_MIME_TYPES:
             raise HTTPException(
                 status_code=400,
                 detail="Apenas arquivos .txt e .md são suportados"
             )
         
-        # Ler conteúdo do arquivo
-        content = await file.read()
-        content_str = content.decode('utf-8')
+        # Ler e decodificar o arquivo em blocos (limite também aplicado aqui,
+        # além do UploadSizeLimitMiddleware que atua antes do parsing)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = io.StringIO()
+        total_bytes = 0
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total_bytes += len(chunk)
+                if total_bytes > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail="O arquivo excede o tamanho máximo de 10 MB"
+                    )
+                buffer.write(decoder.decode(chunk))
+            buffer.write(decoder.decode(b"", final=True))
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=400,
+                detail="O arquivo deve estar codificado em UTF-8"
+            )
+        
+        content_str = buffer.getvalue()
         
         # Verificar se o conteúdo não está vazio
         if not content_str.strip():
@@ -111,13 +188,13 @@ async def upload_document(
             )
         
         # Adicionar documento ao serviço
-        qa_service.add_document(
+        await qa_service.add_document(
             content=content_str,
             filename=file.filename,
             document_type=document_type
         )
         
-        logger.info(f"Documento {file.filename} carregado com sucesso")
+        logger.info("Documento %s carregado com sucesso", file.filename)
         
         return {
             "message": f"Documento {file.filename} carregado com sucesso",
@@ -127,8 +204,10 @@ async def upload_document(
             "total_documents": qa_service.get_document_count()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Erro no upload do documento: {e}")
+        logger.error("Erro no upload do documento: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar documento: {str(e)}"
@@ -136,7 +215,7 @@ async def upload_document(
 
 
 @router.post("/ask", response_model=RAGQueryResponse, tags=["RAG"])
-async def ask_documents(request: RAGQueryRequest):
+async def ask_documents(request: RAGQueryRequest, http_request: Request):
     """
     Endpoint para fazer perguntas sobre documentos carregados (RAG)
     
@@ -144,7 +223,7 @@ async def ask_documents(request: RAGQueryRequest):
     baseadas nos documentos previamente carregados.
     """
     try:
-        logger.info(f"Processando pergunta RAG para sessão {request.session_id}: {request.question[:50]}...")
+        logger.info("Processando pergunta RAG para sessão %s: %s...", request.session_id, request.question[:50])
         
         # Obter resposta RAG do serviço
         answer, sources, latency_ms = await qa_service.get_rag_response(
@@ -157,14 +236,15 @@ async def ask_documents(request: RAGQueryRequest):
             answer=answer,
             sources=sources,
             latency_ms=latency_ms,
-            session_id=request.session_id
+            session_id=request.session_id,
+            timestamp=_request_timestamp(http_request)
         )
         
-        logger.info(f"Resposta RAG enviada com sucesso em {latency_ms}ms")
+        logger.info("Resposta RAG enviada com sucesso em %sms", latency_ms)
         return response
         
     except Exception as e:
-        logger.error(f"Erro no endpoint /ask: {e}")
+        logger.error("Erro no endpoint /ask: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro interno do servidor: {str(e)}"
@@ -177,14 +257,14 @@ async def clear_session(session_id: str):
     Endpoint para limpar histórico de uma sessão específica
     """
     try:
-        qa_service.clear_session_memory(session_id)
+        await qa_service.clear_session_memory(session_id)
         
         return {
             "message": f"Histórico da sessão {session_id} limpo com sucesso"
         }
         
     except Exception as e:
-        logger.error(f"Erro ao limpar sessão {session_id}: {e}")
+        logger.error("Erro ao limpar sessão %s: %s", session_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao limpar sessão: {str(e)}"
@@ -197,11 +277,11 @@ async def get_stats():
     Endpoint para obter estatísticas do serviço
     """
     try:
-        stats = qa_service.get_stats()
+        stats = await qa_service.get_stats()
         return stats
         
     except Exception as e:
-        logger.error(f"Erro ao obter estatísticas: {e}")
+        logger.error("Erro ao obter estatísticas: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao obter estatísticas: {str(e)}"
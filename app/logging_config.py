@@ -0,0 +1,20 @@
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Configurar logging: os registros são enfileirados no request path
+# e escritos por uma thread em segundo plano (QueueListener).
+# Este módulo deve ser importado antes dos demais módulos da aplicação,
+# para que logs emitidos durante os imports (ex.: inicialização do QAService)
+# não sejam descartados; eles ficam na fila até o listener iniciar.
+log_queue = queue.SimpleQueue()
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+)
+queue_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
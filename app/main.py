@@ -1,18 +1,17 @@
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
+from app.logging_config import queue_listener  # Deve vir antes dos imports da aplicação
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
+from fastapi.middleware.cors import CORSMiddleware
 import time
+import asyncio
+from datetime import datetime, timezone
 import logging
 from contextlib import asynccontextmanager
 
-from app.api.chat import router as chat_router
+from app.api.chat import router as chat_router, MAX_UPLOAD_SIZE, MULTIPART_OVERHEAD
 from app.services.qa import qa_service
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 
@@ -20,21 +19,34 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Gerenciador de ciclo de vida da aplicação"""
     # Startup
+    queue_listener.start()
     logger.info("🚀 Iniciando API de Chat com FastAPI + LangChain + Ollama")
     
+    # Restaurar documentos indexados em execuções anteriores
+    if qa_service.load_vector_store():
+        logger.info("📚 Vector store restaurado com %s documentos", qa_service.get_document_count())
+    
     # Verificar conexão com Ollama
     try:
-        if qa_service.check_ollama_connection():
+        if await qa_service.check_ollama_connection():
             logger.info("✅ Conexão com Ollama estabelecida")
+            
+            # Aquecer os modelos antes da primeira requisição
+            try:
+                await qa_service.warmup()
+                logger.info("🔥 Modelos %s e %s carregados", qa_service.model_name, qa_service.embed_model_name)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️  Tempo esgotado ao carregar os modelos - a primeira requisição pode ser lenta")
         else:
             logger.warning("⚠️  Ollama não está conectado - algumas funcionalidades podem não funcionar")
     except Exception as e:
-        logger.error(f"❌ Erro ao conectar com Ollama: {e}")
+        logger.error("❌ Erro ao conectar com Ollama: %s", e)
     
     yield
     
     # Shutdown
     logger.info("🛑 Encerrando API de Chat")
+    queue_listener.stop()
 
 
 # Criar aplicação FastAPI
@@ -54,9 +66,10 @@ app = FastAPI(
     ## 🚀 Como usar
     
     1. **Chat básico**: Use o endpoint `/chat` para conversas simples
-    2. **Upload de documentos**: Use `/upload-document` para carregar arquivos
-    3. **Perguntas sobre documentos**: Use `/ask` para RAG
-    4. **Health check**: Use `/health` para verificar status
+    2. **Chat com streaming**: Use `/chat/stream` para receber tokens via SSE
+    3. **Upload de documentos**: Use `/upload-document` para carregar arquivos
+    4. **Perguntas sobre documentos**: Use `/ask` para RAG
+    5. **Health check**: Use `/health` para verificar status
     
     ## 📊 Monitoramento
     
@@ -75,6 +88,54 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+class UploadSizeLimitMiddleware:
+    """Middleware ASGI que limita o corpo do upload antes do parsing do multipart"""
+    
+    def __init__(self, app, path: str, max_body_size: int):
+        self.app = app
+        self.path = path
+        self.max_body_size = max_body_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        
+        # Rejeitar pelo cabeçalho, sem ler o corpo
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": "O arquivo excede o tamanho máximo de 10 MB"}
+            )
+            await response(scope, receive, send)
+            return
+        
+        # Sem Content-Length confiável: interromper a leitura ao passar do limite
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail="O arquivo excede o tamanho máximo de 10 MB"
+                    )
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+
+# Limitar o tamanho do upload antes que o formulário seja processado
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path="/api/v1/upload-document",
+    max_body_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -91,10 +152,15 @@ async def log_requests(request: Request, call_next):
     """Middleware para log estruturado de requisições"""
     start_time = time.time()
     
+    # Timestamp único da requisição, reutilizado pelos schemas de resposta
+    request.state.timestamp = datetime.fromtimestamp(start_time, timezone.utc)
+    
     # Log da requisição
     logger.info(
-        f"📥 {request.method} {request.url.path} - "
-        f"Client: {request.client.host if request.client else 'unknown'}"
+        "📥 %s %s - Client: %s",
+        request.method,
+        request.url.path,
+        request.client.host if request.client else "unknown"
     )
     
     # Processar requisição
@@ -106,9 +172,11 @@ async def log_requests(request: Request, call_next):
     
     # Log da resposta
     logger.info(
-        f"📤 {request.method} {request.url.path} - "
-        f"Status: {response.status_code} - "
-        f"Time: {process_time_ms}ms"
+        "📤 %s %s - Status: %s - Time: %sms",
+        request.method,
+        request.url.path,
+        response.status_code,
+        process_time_ms
     )
     
     # Adicionar header com tempo de processamento
@@ -133,6 +201,7 @@ async def root():
         "health": "/api/v1/health",
         "endpoints": {
             "chat": "/api/v1/chat",
+            "chat_stream": "/api/v1/chat/stream",
             "upload": "/api/v1/upload-document", 
             "ask": "/api/v1/ask",
             "health": "/api/v1/health",
@@ -145,7 +214,7 @@ async def root():
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Handler global para exceções não tratadas"""
-    logger.error(f"❌ Erro não tratado em {request.url.path}: {exc}")
+    logger.error("❌ Erro não tratado em %s: %s", request.url.path, exc)
     
     return JSONResponse(
         status_code=500,
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 class ChatRequest(BaseModel):
@@ -22,7 +22,7 @@ class ChatResponse(BaseModel):
     answer: str = Field(..., description="Resposta do modelo de linguagem")
     latency_ms: int = Field(..., description="Tempo de resposta em milissegundos")
     session_id: Optional[str] = Field(None, description="ID da sessão")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Timestamp da resposta")
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="Timestamp da resposta")
     
     class Config:
         json_schema_extra = {
@@ -38,7 +38,7 @@ class ChatResponse(BaseModel):
 class HealthResponse(BaseModel):
     """Schema para resposta do health check"""
     status: str = Field(..., description="Status da API")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Timestamp do health check")
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="Timestamp do health check")
     ollama_status: str = Field(..., description="Status do Ollama")
     
     class Config:
@@ -87,7 +87,7 @@ class RAGQueryResponse(BaseModel):
     sources: list[str] = Field(default=[], description="Trechos dos documentos usados como fonte")
     latency_ms: int = Field(..., description="Tempo de resposta em milissegundos")
     session_id: Optional[str] = Field(None, description="ID da sessão")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Timestamp da resposta")
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="Timestamp da resposta")
     
     class Config:
         json_schema_extra = {
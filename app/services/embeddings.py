@@ -0,0 +1,135 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from langchain_ollama import OllamaEmbeddings
+from pydantic import PrivateAttr
+
+
+class EmbeddingBatcher:
+    """Agrupa requisições concorrentes de embedding em uma única chamada (dynamic batching)"""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch: int = 32,
+        max_wait_ms: float = 10
+    ):
+        self._embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        """Inicia a task de processamento no event loop atual, se necessário"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """Enfileira um texto e aguarda o embedding calculado no próximo lote"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Aguarda o primeiro item e coleta outros até max_batch ou max_wait"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Loop de processamento: uma chamada ao Ollama por lote"""
+        while True:
+            batch = await self._collect_batch()
+            try:
+                vectors = await self._embed_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+class BatchedOllamaEmbeddings(OllamaEmbeddings):
+    """Embeddings Ollama enviados em lotes para o endpoint /api/embed"""
+
+    batch_size: int = 64
+    query_batch_size: int = 32
+    query_max_wait_ms: float = 10
+    max_concurrent_batches: int = 4
+
+    _batcher: Optional[EmbeddingBatcher] = PrivateAttr(default=None)
+    _semaphore: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Agrupa índices dos textos em lotes de tamanho semelhante"""
+        # Ordenar por tamanho para que cada lote tenha textos parecidos
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Gera embeddings em lotes, preservando a ordem original"""
+        vectors: List[List[float]] = [None] * len(texts)
+
+        for batch in self._make_batches(texts):
+            embedded = super().embed_documents([texts[i] for i in batch])
+            for i, vector in zip(batch, embedded):
+                vectors[i] = vector
+
+        return vectors
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Envia um único lote ao Ollama"""
+        return await super().aembed_documents(texts)
+
+    async def _aembed_batch_limited(self, texts: List[str]) -> List[List[float]]:
+        """Envia um lote respeitando o limite de lotes simultâneos"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+        async with self._semaphore:
+            return await self._aembed_batch(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Gera embeddings com até max_concurrent_batches lotes em paralelo"""
+        vectors: List[List[float]] = [None] * len(texts)
+        batches = self._make_batches(texts)
+
+        results = await asyncio.gather(
+            *(self._aembed_batch_limited([texts[i] for i in batch]) for batch in batches)
+        )
+
+        for batch, embedded in zip(batches, results):
+            for i, vector in zip(batch, embedded):
+                vectors[i] = vector
+
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Gera o embedding da consulta, agrupando consultas concorrentes"""
+        if self._batcher is None:
+            # Consultas não passam pelo semáforo da ingestão para não esperar uploads grandes
+            self._batcher = EmbeddingBatcher(
+                self._aembed_batch,
+                max_batch=self.query_batch_size,
+                max_wait_ms=self.query_max_wait_ms
+            )
+
+        return await self._batcher.embed(text)
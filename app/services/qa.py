@@ -1,35 +1,123 @@
 import os
 import time
+import hashlib
+import json
+import re
 import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 import asyncio
 
-from langchain_ollama import OllamaLLM, OllamaEmbeddings
+import faiss
+import httpx
+from cachetools import TTLCache
+from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferWindowMemory
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import RetrievalQA
 from langchain.schema import Document
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+from app.services.embeddings import BatchedOllamaEmbeddings
+
 logger = logging.getLogger(__name__)
 
+# Parâmetros do índice HNSW (FAISS)
+HNSW_M = 16                # Vizinhos por nó no grafo
+HNSW_EF_CONSTRUCTION = 128 # Qualidade da construção do grafo
+HNSW_EF_SEARCH = 64        # Amplitude da busca nas consultas
+HNSW_SQ_THRESHOLD = 10_000 # Chunks a partir dos quais o índice é quantizado (8 bits)
+
+# Tempo (segundos) em que o resultado da verificação do Ollama é reaproveitado
+OLLAMA_CHECK_TTL = 5.0
+
+# Tempo máximo (segundos) para carregar os modelos na inicialização
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "60"))
+
+# Cache de respostas para /chat e /ask
+RESPONSE_CACHE_MAXSIZE = 1024
+RESPONSE_CACHE_TTL = 300           # segundos
+CACHE_MAX_TEMPERATURE = 0.3        # Acima disso as respostas não são determinísticas o bastante
+
+# Número de trocas mantidas no histórico de cada sessão
+SESSION_MEMORY_WINDOW = 6
+
+# Sessões inativas são removidas após SESSION_TTL segundos
+SESSION_MAXSIZE = 10_000
+SESSION_TTL = 3600
+
+# Respostas extrativas (sem chamada ao LLM) para perguntas factuais com alta similaridade
+RAG_EXTRACTIVE_ANSWERS = os.getenv("RAG_EXTRACTIVE_ANSWERS", "0") == "1"
+RAG_EXTRACTIVE_THRESHOLD = float(os.getenv("RAG_EXTRACTIVE_THRESHOLD", "0.9"))
+FACTOID_PATTERN = re.compile(
+    r"^\s*(o que é|o que são|quem|quando|onde|qual|quais|quanto|quantos|quantas|"
+    r"what|who|when|where|which|how many|how much)\b",
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _cosine_relevance(distance: float) -> float:
+    """Converte a distância L2 ao quadrado entre vetores normalizados em similaridade de cosseno"""
+    # ||a - b||² = 2 - 2·cos(a, b) para vetores unitários
+    return max(0.0, 1.0 - distance / 2.0)
+
+
+def _sha1(text: str) -> str:
+    """Hash SHA-1 de um texto, usado nas chaves do cache"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SessionCache(TTLCache):
+    """TTLCache de sessões que registra e contabiliza as remoções automáticas"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+    
+    def expire(self, time=None):
+        """Remove sessões cujo TTL expirou (inatividade)"""
+        expired = super().expire(time)
+        for session_id, _ in expired:
+            self.evictions += 1
+            logger.info("Sessão %s removida por inatividade", session_id)
+        return expired
+    
+    def popitem(self):
+        """Remove a sessão mais antiga quando o limite de sessões é atingido"""
+        session_id, memory = super().popitem()
+        self.evictions += 1
+        logger.info("Sessão %s removida por limite de capacidade (%s sessões)", session_id, self.maxsize)
+        return session_id, memory
+
 
 class QAService:
     """Serviço de QA usando LangChain com Ollama"""
     
-    def __init__(self, model_name: str = None, base_url: str = None):
+    def __init__(self, model_name: str = None, base_url: str = None, embed_model_name: str = None,
+                 vector_store_path: str = None):
         self.model_name = model_name or os.getenv("OLLAMA_MODEL", "llama3")
+        self.embed_model_name = embed_model_name or os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+        self.vector_store_path = vector_store_path or os.getenv("VECTOR_STORE_PATH", "data/vector_store")
         self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.llm = None
         self.embeddings = None
         self.vector_store = None
-        self.sessions: Dict[str, ConversationBufferMemory] = {}
-        self.documents: List[Document] = []
+        self.sessions: SessionCache = SessionCache(maxsize=SESSION_MAXSIZE, ttl=SESSION_TTL)
+        self._sessions_lock = asyncio.Lock()
+        # Apenas os metadados dos documentos; o conteúdo fica no vector store
+        self.documents: List[Dict] = []
+        self._last_ok = False
+        self._last_check_ts = float("-inf")
+        self._response_cache = TTLCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL)
+        self._cache_lock = asyncio.Lock()
+        self._ingest_lock = asyncio.Lock()
+        self._persistence_disabled = False
+        self.vector_store_version = 0
         
         # Templates de prompt
         self.chat_template = """Você é um assistente inteligente e prestativo. Responda de forma clara, precisa e educada.
@@ -51,6 +139,21 @@ Pergunta: {question}
 
 Resposta baseada nos documentos:"""
         
+        # Prompt compilado uma única vez e compartilhado entre as requisições
+        self._chat_prompt = PromptTemplate(
+            input_variables=["history", "question"],
+            template=self.chat_template
+        )
+        self._llm_chain: Optional[LLMChain] = None
+        self._qa_chain: Optional[RetrievalQA] = None
+        
+        # Splitter reutilizado em todos os uploads
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            length_function=len
+        )
+        
         self._initialize_llm()
     
     def _initialize_llm(self):
@@ -64,28 +167,91 @@ Resposta baseada nos documentos:"""
                 num_ctx=2048,         # Contexto menor
                 repeat_penalty=1.1,   # Evitar repetições
                 top_k=20,            # Limitar vocabulário
-                top_p=0.9            # Nucleus sampling
+                top_p=0.9,           # Nucleus sampling
+                keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),  # Manter modelo carregado entre picos
+                # Threads do Ollama (o serviço roda em outro container); padrão do Ollama se não definido
+                num_thread=int(os.environ["OLLAMA_NUM_THREAD"]) if os.getenv("OLLAMA_NUM_THREAD") else None
             )
             
-            self.embeddings = OllamaEmbeddings(
-                model=self.model_name,
-                base_url=self.base_url
+            # Modelo dedicado a embeddings (muito mais leve que o LLM de chat)
+            self.embeddings = BatchedOllamaEmbeddings(
+                model=self.embed_model_name,
+                base_url=self.base_url,
+                batch_size=int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "64")),
+                max_concurrent_batches=int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4"))
             )
             
-            logger.info(f"LLM inicializado com sucesso: {self.model_name}")
+            # Chain de chat única, sem memória: o histórico da sessão é
+            # carregado e salvo em torno de cada chamada
+            self._llm_chain = LLMChain(
+                llm=self.llm,
+                prompt=self._chat_prompt,
+                verbose=False
+            )
+            
+            logger.info("LLM inicializado com sucesso: %s (embeddings: %s)", self.model_name, self.embed_model_name)
         except Exception as e:
-            logger.error(f"Erro ao inicializar LLM: {e}")
+            logger.error("Erro ao inicializar LLM: %s", e)
             raise
     
-    def check_ollama_connection(self) -> bool:
+    async def check_ollama_connection(self) -> bool:
         """Verifica se o Ollama está conectado"""
+        now = time.monotonic()
+        if now - self._last_check_ts < OLLAMA_CHECK_TTL:
+            return self._last_ok
+        
         try:
-            # Teste simples para verificar conexão
-            response = self.llm.invoke("Hello")
-            return True
+            # Requisição leve que não executa o modelo
+            async with httpx.AsyncClient(timeout=2.0) as client:
+                response = await client.get(f"{self.base_url}/api/tags")
+            self._last_ok = response.status_code == 200
         except Exception as e:
-            logger.error(f"Erro na conexão com Ollama: {e}")
-            return False
+            logger.error("Erro na conexão com Ollama: %s", e)
+            self._last_ok = False
+        
+        self._last_check_ts = now
+        return self._last_ok
+    
+    async def _load_models(self):
+        """Carrega os modelos de chat e de embeddings no Ollama sem gerar texto"""
+        keep_alive = self.llm.keep_alive
+        async with httpx.AsyncClient(timeout=None) as client:
+            # Prompt vazio apenas carrega o modelo na memória
+            response = await client.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model_name, "prompt": "", "keep_alive": keep_alive}
+            )
+            response.raise_for_status()
+            
+            response = await client.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.embed_model_name, "input": "warmup", "keep_alive": keep_alive}
+            )
+            response.raise_for_status()
+    
+    async def warmup(self):
+        """Carrega os modelos no Ollama para que a primeira requisição não pague o custo"""
+        await asyncio.wait_for(self._load_models(), timeout=OLLAMA_WARMUP_TIMEOUT)
+    
+    def _cache_enabled(self) -> bool:
+        """Indica se as respostas podem ser reaproveitadas do cache"""
+        return (self.llm.temperature or 0.0) <= CACHE_MAX_TEMPERATURE
+    
+    async def _get_cached_response(self, key: Tuple):
+        """Busca uma resposta no cache (None se ausente ou desabilitado)"""
+        if not self._cache_enabled():
+            return None
+        
+        async with self._cache_lock:
+            return self._response_cache.get(key)
+    
+    async def _set_cached_response(self, key: Tuple, value):
+        """Armazena uma resposta no cache"""
+        if not self._cache_enabled():
+            return
+        
+        async with self._cache_lock:
+            self._response_cache[key] = value
     
     async def get_chat_response(self, message: str, session_id: Optional[str] = None) -> Tuple[str, int]:
         """
@@ -102,56 +268,154 @@ Resposta baseada nos documentos:"""
         
         try:
             # Configurar memória da sessão
-            memory = self._get_or_create_session_memory(session_id)
+            memory = await self._get_or_create_session_memory(session_id)
             
-            # Criar prompt template
-            prompt = PromptTemplate(
-                input_variables=["history", "question"],
-                template=self.chat_template
-            )
+            # Chave do cache: modelo + mensagem + histórico atual da sessão
+            history = memory.load_memory_variables({})[memory.memory_key]
+            cache_key = ("chat", self.model_name, _sha1(message), _sha1(str(history)))
             
-            # Criar chain
-            chain = LLMChain(
-                llm=self.llm,
-                prompt=prompt,
-                memory=memory,
-                verbose=False
-            )
+            cached = await self._get_cached_response(cache_key)
+            if cached is not None:
+                # Manter o histórico da sessão consistente mesmo sem chamar o LLM
+                memory.save_context({"question": message}, {"text": cached})
+                latency_ms = int((time.time() - start_time) * 1000)
+                logger.info("Resposta do cache em %sms para sessão %s", latency_ms, session_id)
+                return cached, latency_ms
             
-            # Executar chain
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, chain.run, {"question": message}
-            )
+            # Executar chain compartilhada (I/O assíncrono com o Ollama)
+            result = await self._llm_chain.ainvoke({"history": history, "question": message})
+            response = result["text"].strip()
+            
+            # Registrar a troca no histórico da sessão
+            memory.save_context({"question": message}, {"text": response})
+            await self._set_cached_response(cache_key, response)
             
             # Calcular latência
             latency_ms = int((time.time() - start_time) * 1000)
             
-            logger.info(f"Resposta gerada em {latency_ms}ms para sessão {session_id}")
+            logger.info("Resposta gerada em %sms para sessão %s", latency_ms, session_id)
             
-            return response.strip(), latency_ms
+            return response, latency_ms
             
         except Exception as e:
-            logger.error(f"Erro ao gerar resposta: {e}")
+            logger.error("Erro ao gerar resposta: %s", e)
             latency_ms = int((time.time() - start_time) * 1000)
             return f"Desculpe, ocorreu um erro ao processar sua mensagem: {str(e)}", latency_ms
     
-    def _get_or_create_session_memory(self, session_id: Optional[str]) -> ConversationBufferMemory:
+    async def stream_chat_response(self, message: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Gera a resposta do chat token a token
+        
+        Args:
+            message: Mensagem do usuário
+            session_id: ID da sessão para manter histórico
+            
+        Yields:
+            Trechos da resposta conforme são produzidos pelo modelo
+        """
+        start_time = time.time()
+        
+        memory = await self._get_or_create_session_memory(session_id)
+        history = memory.load_memory_variables({})[memory.memory_key]
+        prompt = self._chat_prompt.format(history=history, question=message)
+        
+        parts = []
+        async for chunk in self.llm.astream(prompt):
+            # O Ollama encerra o stream com um chunk vazio
+            if not chunk:
+                continue
+            parts.append(chunk)
+            yield chunk
+        
+        # Registrar a troca completa no histórico da sessão
+        memory.save_context({"question": message}, {"text": "".join(parts).strip()})
+        
+        latency_ms = int((time.time() - start_time) * 1000)
+        logger.info("Resposta em streaming concluída em %sms para sessão %s", latency_ms, session_id)
+    
+    async def _get_or_create_session_memory(self, session_id: Optional[str]) -> ConversationBufferWindowMemory:
         """Obtém ou cria memória para uma sessão"""
         if not session_id:
-            return ConversationBufferMemory()
+            return ConversationBufferWindowMemory(k=SESSION_MEMORY_WINDOW)
         
-        if session_id not in self.sessions:
-            self.sessions[session_id] = ConversationBufferMemory()
+        async with self._sessions_lock:
+            memory = self.sessions.get(session_id)
+            if memory is None:
+                memory = ConversationBufferWindowMemory(k=SESSION_MEMORY_WINDOW)
+            
+            # Reinserir renova o TTL: só expiram sessões inativas
+            self.sessions[session_id] = memory
         
-        return self.sessions[session_id]
+        return memory
     
-    def clear_session_memory(self, session_id: str):
+    async def clear_session_memory(self, session_id: str):
         """Limpa a memória de uma sessão específica"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            logger.info(f"Memória da sessão {session_id} limpa")
+        async with self._sessions_lock:
+            if session_id in self.sessions:
+                del self.sessions[session_id]
+                logger.info("Memória da sessão %s limpa", session_id)
+    
+    async def _create_vector_store(self) -> FAISS:
+        """Cria um vector store FAISS vazio com índice HNSW"""
+        dimension = len(await self.embeddings.aembed_query("dimensão"))
+        
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore({}),
+            index_to_docstore_id={},
+            normalize_L2=True,
+            relevance_score_fn=_cosine_relevance
+        )
+    
+    def _needs_quantization(self) -> bool:
+        """Indica se o índice atingiu o limite para ser quantizado"""
+        index = self.vector_store.index
+        return not isinstance(index, faiss.IndexHNSWSQ) and index.ntotal >= HNSW_SQ_THRESHOLD
     
-    def add_document(self, content: str, filename: str, document_type: str = "text"):
+    @staticmethod
+    def _build_quantized_index(index) -> "faiss.IndexHNSWSQ":
+        """Cria uma cópia do índice em HNSW com quantização escalar de 8 bits"""
+        # Os vetores mantêm a mesma ordem, então o mapeamento do docstore continua válido
+        vectors = index.reconstruct_n(0, index.ntotal)
+        
+        quantized = faiss.IndexHNSWSQ(index.d, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+        quantized.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        quantized.hnsw.efSearch = HNSW_EF_SEARCH
+        quantized.train(vectors)
+        quantized.add(vectors)
+        return quantized
+    
+    async def _maybe_quantize_index(self):
+        """
+        Converte o índice para HNSW SQ8 quando o corpus cresce
+        
+        Deve ser chamado com self._ingest_lock adquirido: nenhuma inserção pode
+        ocorrer entre a cópia dos vetores e a troca do índice.
+        """
+        if not self._needs_quantization():
+            return
+        
+        index = self.vector_store.index
+        
+        # Reconstrução e treino fora do event loop; consultas seguem no índice antigo
+        quantized = await asyncio.get_event_loop().run_in_executor(
+            None, self._build_quantized_index, index
+        )
+        
+        if quantized.ntotal != len(self.vector_store.index_to_docstore_id):
+            logger.error("Quantização descartada: índice e docstore fora de sincronia")
+            return
+        
+        # Troca feita no event loop, de forma atômica para as consultas
+        self.vector_store.index = quantized
+        logger.info("Índice FAISS quantizado (HNSW SQ8) com %s vetores", quantized.ntotal)
+    
+    async def add_document(self, content: str, filename: str, document_type: str = "text"):
         """
         Adiciona um documento ao vector store para RAG
         
@@ -167,35 +431,167 @@ Resposta baseada nos documentos:"""
                 metadata={
                     "filename": filename,
                     "type": document_type,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": datetime.now(timezone.utc).isoformat()
                 }
             )
             
-            self.documents.append(doc)
+            # Dividir apenas o novo documento em chunks
+            chunks = self.text_splitter.split_documents([doc])
             
-            # Dividir texto em chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
-            )
+            # Uploads concorrentes são serializados: criação do vector store,
+            # inserção, quantização e persistência não podem se intercalar
+            async with self._ingest_lock:
+                # Criar vector store na primeira carga e inserir incrementalmente
+                if self.vector_store is None:
+                    self.vector_store = await self._create_vector_store()
+                
+                # Embeddings gerados em lotes assíncronos
+                await self.vector_store.aadd_documents(chunks)
+                self.documents.append(doc.metadata)
+                
+                # Quantizar o índice (uma única vez) quando atingir o limite
+                await self._maybe_quantize_index()
+                
+                # Invalida respostas RAG em cache
+                self.vector_store_version += 1
+                
+                # Persistir índice e metadados em disco; uma falha aqui não desfaz
+                # o upload, que já está disponível em memória
+                try:
+                    await asyncio.get_event_loop().run_in_executor(None, self._persist, doc)
+                except Exception as e:
+                    logger.error("Erro ao persistir vector store: %s", e)
             
-            chunks = text_splitter.split_documents(self.documents)
-            
-            # Criar ou atualizar vector store
-            if self.vector_store is None:
-                self.vector_store = FAISS.from_documents(chunks, self.embeddings)
-            else:
-                # Adicionar novos documentos ao vector store existente
-                new_vector_store = FAISS.from_documents([doc], self.embeddings)
-                self.vector_store.merge_from(new_vector_store)
-            
-            logger.info(f"Documento {filename} adicionado ao vector store")
+            logger.info("Documento %s adicionado ao vector store", filename)
             
         except Exception as e:
-            logger.error(f"Erro ao adicionar documento: {e}")
+            logger.error("Erro ao adicionar documento: %s", e)
             raise
     
+    def _documents_file(self) -> str:
+        """Caminho do arquivo com os documentos carregados"""
+        return os.path.join(self.vector_store_path, "documents.jsonl")
+    
+    def _persist(self, doc: Document):
+        """
+        Acrescenta os metadados do documento ao arquivo de documentos e salva o vector store
+        
+        Deve ser chamado com self._ingest_lock adquirido. Os arquivos do índice
+        são gravados em um diretório temporário e movidos com os.replace, para
+        que uma falha no meio da gravação não corrompa o índice anterior.
+        """
+        if self._persistence_disabled:
+            logger.warning("Persistência desativada: o vector store em disco não pôde ser carregado")
+            return
+        
+        os.makedirs(self.vector_store_path, exist_ok=True)
+        
+        # Documentos primeiro: em caso de falha, o índice anterior continua íntegro
+        with open(self._documents_file(), "ab") as f:
+            # Garantir que a nova linha não seja colada a uma linha incompleta
+            if f.tell() > 0:
+                with open(self._documents_file(), "rb") as existing:
+                    existing.seek(-1, os.SEEK_END)
+                    if existing.read(1) != b"\n":
+                        f.write(b"\n")
+            
+            line = json.dumps({"metadata": doc.metadata}, ensure_ascii=False) + "\n"
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        tmp_path = os.path.join(self.vector_store_path, ".tmp")
+        self.vector_store.save_local(tmp_path)
+        for name in ("index.pkl", "index.faiss"):
+            os.replace(os.path.join(tmp_path, name), os.path.join(self.vector_store_path, name))
+    
+    def _load_documents_file(self) -> List[Dict]:
+        """
+        Lê os metadados do arquivo de documentos, tolerando linhas inválidas
+        
+        Uma última linha incompleta (gravação interrompida) é removida do arquivo;
+        linhas inválidas no meio do arquivo são ignoradas.
+        """
+        path = self._documents_file()
+        if not os.path.exists(path):
+            return []
+        
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        
+        documents = []
+        valid_size = 0
+        for i, raw in enumerate(lines):
+            try:
+                if raw.strip():
+                    documents.append(json.loads(raw)["metadata"])
+                valid_size += len(raw)
+            except (ValueError, KeyError, TypeError):
+                if i == len(lines) - 1:
+                    logger.warning("Última linha de %s incompleta; removendo", path)
+                    with open(path, "r+b") as f:
+                        f.truncate(valid_size)
+                else:
+                    logger.warning("Linha %s de %s inválida; ignorando", i + 1, path)
+                    valid_size += len(raw)
+        
+        return documents
+    
+    def load_vector_store(self) -> bool:
+        """
+        Carrega o vector store persistido em disco, se existir
+        
+        O índice é carregado independentemente do arquivo de documentos. Se o
+        índice existir mas não puder ser carregado, a persistência é desativada
+        para que novos uploads não sobrescrevam os arquivos em disco.
+        
+        Returns:
+            True se um vector store foi carregado
+        """
+        if not os.path.exists(os.path.join(self.vector_store_path, "index.faiss")):
+            return False
+        
+        try:
+            self.vector_store = FAISS.load_local(
+                self.vector_store_path,
+                self.embeddings,
+                allow_dangerous_deserialization=True,
+                normalize_L2=True,
+                relevance_score_fn=_cosine_relevance
+            )
+        except Exception as e:
+            logger.error("Erro ao carregar vector store (persistência desativada): %s", e)
+            self.vector_store = None
+            self.documents = []
+            self._persistence_disabled = True
+            return False
+        
+        index = self.vector_store.index
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        
+        try:
+            self.documents = self._load_documents_file()
+        except Exception as e:
+            logger.error("Erro ao ler arquivo de documentos: %s", e)
+            self.documents = []
+        
+        self.vector_store_version += 1
+        logger.info("Vector store carregado de %s (%s documentos)", self.vector_store_path, len(self.documents))
+        return True
+    
+    def _get_qa_chain(self) -> RetrievalQA:
+        """Retorna a chain de retrieval, recriando-a apenas se o vector store mudar"""
+        if self._qa_chain is None or self._qa_chain.retriever.vectorstore is not self.vector_store:
+            self._qa_chain = RetrievalQA.from_chain_type(
+                llm=self.llm,
+                chain_type="stuff",
+                retriever=self.vector_store.as_retriever(search_kwargs={"k": 3}),
+                return_source_documents=True
+            )
+        
+        return self._qa_chain
+    
     async def get_rag_response(self, question: str, session_id: Optional[str] = None) -> Tuple[str, List[str], int]:
         """
         Obtém resposta usando RAG (Retrieval Augmented Generation)
@@ -214,42 +610,99 @@ Resposta baseada nos documentos:"""
                 latency_ms = int((time.time() - start_time) * 1000)
                 return "Nenhum documento foi carregado ainda. Por favor, faça upload de documentos primeiro.", [], latency_ms
             
-            # Criar chain de retrieval
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vector_store.as_retriever(search_kwargs={"k": 3}),
-                return_source_documents=True
-            )
+            # Chave do cache: pergunta + versão do vector store
+            cache_key = ("ask", self.model_name, _sha1(question), self.vector_store_version)
             
-            # Executar query
-            result = await asyncio.get_event_loop().run_in_executor(
-                None, qa_chain, {"query": question}
-            )
+            cached = await self._get_cached_response(cache_key)
+            if cached is not None:
+                answer, sources = cached
+                latency_ms = int((time.time() - start_time) * 1000)
+                logger.info("Resposta RAG do cache em %sms para sessão %s", latency_ms, session_id)
+                return answer, list(sources), latency_ms
+            
+            # Atalho extrativo para perguntas factuais com alta confiança
+            source_docs = None
+            if RAG_EXTRACTIVE_ANSWERS and FACTOID_PATTERN.match(question):
+                results = await self.vector_store.asimilarity_search_with_relevance_scores(question, k=3)
+                extractive = self._get_extractive_answer(question, results)
+                if extractive is not None:
+                    answer, sources = extractive
+                    await self._set_cached_response(cache_key, (answer, tuple(sources)))
+                    latency_ms = int((time.time() - start_time) * 1000)
+                    logger.info("Resposta RAG extrativa em %sms para sessão %s", latency_ms, session_id)
+                    return answer, sources, latency_ms
+                
+                source_docs = [doc for doc, _ in results]
             
-            # Extrair resposta e fontes
-            answer = result["result"].strip()
-            source_docs = result["source_documents"]
+            qa_chain = self._get_qa_chain()
+            
+            # Executar query (I/O assíncrono com o Ollama)
+            if source_docs is None:
+                result = await qa_chain.ainvoke({"query": question})
+                answer = result["result"].strip()
+                source_docs = result["source_documents"]
+            else:
+                # Reaproveitar os documentos já recuperados, sem nova busca
+                result = await qa_chain.combine_documents_chain.ainvoke(
+                    {"input_documents": source_docs, "question": question}
+                )
+                answer = result[qa_chain.combine_documents_chain.output_key].strip()
             
             # Formatar fontes
-            sources = []
-            for doc in source_docs:
-                source_text = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                filename = doc.metadata.get("filename", "documento")
-                sources.append(f"[{filename}] {source_text}")
+            sources = self._format_sources(source_docs)
+            
+            await self._set_cached_response(cache_key, (answer, tuple(sources)))
             
             # Calcular latência
             latency_ms = int((time.time() - start_time) * 1000)
             
-            logger.info(f"Resposta RAG gerada em {latency_ms}ms para sessão {session_id}")
+            logger.info("Resposta RAG gerada em %sms para sessão %s", latency_ms, session_id)
             
             return answer, sources, latency_ms
             
         except Exception as e:
-            logger.error(f"Erro ao gerar resposta RAG: {e}")
+            logger.error("Erro ao gerar resposta RAG: %s", e)
             latency_ms = int((time.time() - start_time) * 1000)
             return f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}", [], latency_ms
     
+    def _format_sources(self, docs: List[Document]) -> List[str]:
+        """Formata os trechos dos documentos usados como fonte"""
+        sources = []
+        for doc in docs:
+            source_text = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+            filename = doc.metadata.get("filename", "documento")
+            sources.append(f"[{filename}] {source_text}")
+        
+        return sources
+    
+    def _get_extractive_answer(
+        self, question: str, results: List[Tuple[Document, float]]
+    ) -> Optional[Tuple[str, List[str]]]:
+        """
+        Tenta responder extraindo um trecho do documento mais similar, sem chamar o LLM
+        
+        Args:
+            question: Pergunta do usuário
+            results: Documentos recuperados com seus scores de relevância
+            
+        Returns:
+            Tuple com (resposta, fontes) ou None se a similaridade ficar abaixo do limite
+        """
+        if not results or results[0][1] < RAG_EXTRACTIVE_THRESHOLD:
+            return None
+        
+        # Selecionar a frase do melhor chunk com mais termos em comum com a pergunta
+        top_doc = results[0][0]
+        terms = {w.lower() for w in WORD_PATTERN.findall(question) if len(w) > 2}
+        sentences = [s.strip() for s in SENTENCE_PATTERN.split(top_doc.page_content) if s.strip()]
+        answer = max(
+            sentences,
+            key=lambda s: len(terms & {w.lower() for w in WORD_PATTERN.findall(s)}),
+            default=top_doc.page_content.strip()
+        )
+        
+        return answer, self._format_sources([doc for doc, _ in results])
+    
     def get_document_count(self) -> int:
         """Retorna o número de documentos carregados"""
         return len(self.documents)
@@ -258,14 +711,16 @@ Resposta baseada nos documentos:"""
         """Retorna o número de sessões ativas"""
         return len(self.sessions)
     
-    def get_stats(self) -> Dict:
+    async def get_stats(self) -> Dict:
         """Retorna estatísticas do serviço"""
         return {
             "model_name": self.model_name,
+            "embed_model_name": self.embed_model_name,
             "base_url": self.base_url,
             "documents_loaded": self.get_document_count(),
             "active_sessions": self.get_session_count(),
-            "ollama_connected": self.check_ollama_connection()
+            "evicted_sessions": self.sessions.evictions,
+            "ollama_connected": await self.check_ollama_connection()
         }
 
 
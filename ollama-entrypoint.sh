@@ -28,6 +28,14 @@ if [ "${OLLAMA_AUTO_PULL:-}" = "1" ]; then
     exit 1
   fi
   echo "Modelo $MODEL baixado."
+
+  EMBED_MODEL="${OLLAMA_EMBED_MODEL:-nomic-embed-text}"
+  echo "Baixando modelo de embeddings: $EMBED_MODEL"
+  if ! ollama pull "$EMBED_MODEL"; then
+    echo "Falha no pull de $EMBED_MODEL"
+    exit 1
+  fi
+  echo "Modelo $EMBED_MODEL baixado."
 fi
 
 # 4) Mantém o processo principal vivo
@@ -42,6 +42,41 @@ def test_chat():
         print(f"❌ Erro: {e}")
         return False
 
+def test_chat_stream():
+    """Testa o endpoint de chat com streaming (SSE)"""
+    print("\n🌊 Testando chat com streaming...")
+    try:
+        data = {
+            "message": "Qual a capital da França?",
+            "session_id": "test-session-stream"
+        }
+        tokens = []
+        done_event = None
+        with requests.post(f"{BASE_URL}/chat/stream", json=data, stream=True) as response:
+            print(f"Status: {response.status_code}")
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "error" in event:
+                    print(f"❌ Erro no stream: {event['error']}")
+                    return False
+                if event.get("done"):
+                    done_event = event
+                    break
+                tokens.append(event["token"])
+        
+        print(f"Resposta: {''.join(tokens)}")
+        print(f"Tokens recebidos: {len(tokens)}")
+        if done_event is None:
+            print("❌ Evento 'done' não recebido")
+            return False
+        print(f"Latência: {done_event['latency_ms']}ms")
+        return response.status_code == 200 and all(tokens)
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        return False
+
 def test_upload_document():
     """Testa o upload de documento"""
     print("\n📄 Testando upload de documento...")
@@ -108,6 +143,7 @@ def main():
     tests = [
         ("Health Check", test_health),
         ("Chat Básico", test_chat),
+        ("Chat com Streaming", test_chat_stream),
         ("Upload de Documento", test_upload_document),
         ("Consulta RAG", test_rag_query),
         ("Estatísticas", test_stats)